@@ -12,6 +12,7 @@ class Settings(BaseSettings):
     lstm_model_path: str = "app/models/saved/lstm_model.keras"
     preprocessor_path: str = "app/models/saved/preprocessor.pkl"
     label_encoder_path: str = "app/models/saved/label_encoder.pkl"
+    cache_dir: str = "data/cache"
 
     class Config:
         env_file = ".env"
@@ -1,7 +1,14 @@
 import httpx
 import asyncio
+import joblib
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
+from pathlib import Path
+from app.core.config import settings
 from app.core.logging import logger, setup_logging
 
 setup_logging()
@@ -27,6 +34,38 @@ class WeatherDataFetcher:
         "soil_moisture_7_to_28cm",
     ]
 
+    # Part of the historical cache key; bump it whenever _hourly_frame changes
+    # the dtypes or columns of the frames it produces
+    CACHE_FORMAT = 2
+
+    def __init__(self, client: httpx.AsyncClient | None = None):
+        # One pooled HTTP/2 client for every request this fetcher makes;
+        # call aclose() when done with it
+        self._client = client or httpx.AsyncClient(
+            http2=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=16)
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _hourly_frame(self, payload: bytes) -> pd.DataFrame:
+        """
+        Parses an Open-Meteo response body straight into typed columns.
+        Missing readings come back as null and become NaN in the float cast.
+        """
+        hourly = orjson.loads(payload)["hourly"]
+        # Timestamps are fixed-format ISO8601 ("2024-01-01T00:00"), so numpy
+        # parses them directly; seconds is the coarsest unit pandas keeps as-is
+        columns = {"time": np.asarray(hourly["time"], dtype="datetime64[s]")}
+        # float64 keeps the exact values json decoding gives: 0.1 mm readings
+        # rounded to float32 move 24h sums off the 15/30 mm label thresholds
+        for var in self.HOURLY_VARIABLES:
+            if var in hourly:
+                columns[var] = np.asarray(hourly[var], dtype=np.float64)
+        return pd.DataFrame(columns)
+
     async def fetch_historical(
         self,
         lat: float,
@@ -35,8 +74,6 @@ class WeatherDataFetcher:
         end_date: str
     ) -> pd.DataFrame:
 
-        logger.info(f"Fetching historical: ({lat}, {lon}) {start_date} to {end_date}")
-
         params = {
             "latitude": lat,
             "longitude": lon,
@@ -48,16 +85,30 @@ class WeatherDataFetcher:
             "precipitation_unit": "mm"
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(self.ARCHIVE_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+        # Keyed on the full request plus the frame format. The archive publishes
+        # the latest days late, so a window ending today can hold missing hours
+        # and is served as-is until end_date changes; delete the cached file to
+        # force a refresh.
+        cache_file = (
+            Path(settings.cache_dir) / "historical"
+            / f"{joblib.hash((self.CACHE_FORMAT, self.ARCHIVE_URL, params))}.pkl"
+        )
+        if cache_file.exists():
+            logger.info(f"Using cached historical: ({lat}, {lon}) {start_date} to {end_date}")
+            return joblib.load(cache_file)
+
+        logger.info(f"Fetching historical: ({lat}, {lon}) {start_date} to {end_date}")
 
-        df = pd.DataFrame(data["hourly"])
-        df["time"] = pd.to_datetime(df["time"])
+        response = await self._client.get(self.ARCHIVE_URL, params=params)
+        response.raise_for_status()
+
+        df = self._hourly_frame(response.content)
         df["latitude"] = lat
         df["longitude"] = lon
         logger.info(f"Got {len(df)} records")
+
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(df, cache_file)
         return df
 
     async def fetch_forecast(self, lat: float, lon: float) -> pd.DataFrame:
@@ -71,20 +122,16 @@ class WeatherDataFetcher:
             "timezone": "auto"
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(self.FORECAST_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+        response = await self._client.get(self.FORECAST_URL, params=params, timeout=30.0)
+        response.raise_for_status()
 
-        df = pd.DataFrame(data["hourly"])
-        df["time"] = pd.to_datetime(df["time"])
-        return df
+        return self._hourly_frame(response.content)
 
 
 async def download_training_data():
     """
     Downloads 5 years of data for all 8 seeded regions.
-    Run this ONCE. Saves to data/processed/training_data.csv.
+    Run this ONCE. Saves to data/processed/training_data.parquet.
     """
     fetcher = WeatherDataFetcher()
 
@@ -102,27 +149,54 @@ async def download_training_data():
     end_date   = datetime.now().strftime("%Y-%m-%d")
     start_date = (datetime.now() - timedelta(days=5 * 365)).strftime("%Y-%m-%d")
 
-    all_dfs = []
+    # At most 3 requests in flight, each slot pausing 1s after its fetch,
+    # keeps us well inside Open-Meteo's free-tier rate limit
+    semaphore = asyncio.Semaphore(3)
 
-    for region in regions:
+    async def fetch_region(region: dict) -> pd.DataFrame | None:
         try:
-            df = await fetcher.fetch_historical(
-                lat=region["lat"],
-                lon=region["lon"],
-                start_date=start_date,
-                end_date=end_date
-            )
-            df["region_name"] = region["name"]
-            all_dfs.append(df)
-            logger.info(f"Done: {region['name']} — {len(df)} rows")
-            await asyncio.sleep(1)
+            async with semaphore:
+                df = await fetcher.fetch_historical(
+                    lat=region["lat"],
+                    lon=region["lon"],
+                    start_date=start_date,
+                    end_date=end_date
+                )
+                await asyncio.sleep(1)
         except Exception as e:
             logger.error(f"Failed {region['name']}: {e}")
+            return None
+        df["region_name"] = pd.Categorical([region["name"]] * len(df))
+        logger.info(f"Done: {region['name']} — {len(df)} rows")
+        return df
 
-    combined = pd.concat(all_dfs, ignore_index=True)
-    combined.to_csv("data/processed/training_data.csv", index=False)
-    logger.info(f"Saved {len(combined)} total rows to data/processed/training_data.csv")
-    return combined
+    # Each region becomes its own row group as soon as it arrives, so only the
+    # regions still in flight are held in memory, never the combined frame
+    path = "data/processed/training_data.parquet"
+    writer = None
+    total_rows = 0
+    try:
+        for fetched in asyncio.as_completed([fetch_region(r) for r in regions]):
+            df = await fetched
+            if df is None:
+                continue
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    path, table.schema, compression="zstd", compression_level=6
+                )
+            writer.write_table(table)
+            total_rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+        await fetcher.aclose()
+
+    if writer is None:
+        raise RuntimeError(f"No region could be downloaded; {path} was not written")
+
+    logger.info(f"Saved {total_rows} total rows to {path}")
+    return path
 
 
 if __name__ == "__main__":
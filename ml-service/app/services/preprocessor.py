@@ -1,10 +1,238 @@
 import pandas as pd
 import numpy as np
+from numba import njit
 from sklearn.preprocessing import StandardScaler
 import joblib
+import pickle
+import zstandard as zstd
 from pathlib import Path
 from app.core.logging import logger
 
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# Explicit signatures compile the kernels at import, keeping JIT latency
+# out of the first engineer_features call
+# Every kernel takes pos, each row's offset within its region, and restarts
+# wherever pos is 0 so that no window or recursion crosses a region boundary
+@njit("float64[:](float64[:], int64[:], float64)", cache=True, fastmath=True)
+def _apid(p, pos, k):
+    """Antecedent Precipitation Index: API_t = k * (API_{t-1} + P_t), API_0 = 0."""
+    out = np.zeros_like(p)
+    acc = 0.0
+    for i in range(p.shape[0]):
+        if pos[i] == 0:
+            acc = 0.0
+        else:
+            acc = k * (acc + p[i])
+            out[i] = acc
+    return out
+
+
+def _diff(a, n, pos):
+    """a[i] - a[i - n], 0 for the first n rows (Series.diff(n).fillna(0))."""
+    out = np.zeros_like(a)
+    out[n:] = a[n:] - a[:-n]
+    out[pos < n] = 0
+    return out
+
+
+# No fastmath here: it would let LLVM fold away the Kahan compensation terms
+@njit(
+    "Tuple((float64[:, :], float64[:], float64[:], float64[:]))(float64[:], int64[:], int64[:])",
+    cache=True
+)
+def _windows(p, pos, sum_windows):
+    """
+    Single pass over precipitation returning (rolling sums, 6h max, 24h max,
+    24h sample std). Row j of the sums covers sum_windows[j] hours with
+    min_periods=1. Max and std stay 0 until their first full window, matching
+    pandas rolling(w).max()/.std() followed by fillna(0).
+    """
+    n = p.shape[0]
+    n_sums = sum_windows.shape[0]
+    sums = np.zeros((n_sums, n))
+    max6 = np.zeros(n)
+    max24 = np.zeros(n)
+    std24 = np.zeros(n)
+
+    # Monotonic deques of indices whose values decrease from head to tail,
+    # so the head is always the window maximum
+    dq6 = np.empty(n, np.int64)
+    dq24 = np.empty(n, np.int64)
+    head6 = tail6 = head24 = tail24 = 0
+
+    # Running sums use the same Kahan-compensated add/remove as pandas'
+    # rolling().sum(), with separate compensation for values entering and
+    # leaving the window. A run of identical values is reported as value * count,
+    # again like pandas, so sums land on the same bits and threshold
+    # comparisons in create_labels match pandas exactly.
+    sum_x = np.zeros(n_sums)
+    comp_add = np.zeros(n_sums)
+    comp_remove = np.zeros(n_sums)
+    same_run = 0
+    prev = 0.0
+
+    # Welford accumulators for the sliding 24h window; wet counts the non-zero
+    # hours in it so dry spells reset to an exact 0 instead of round-off drift
+    nobs = 0
+    wet = 0
+    mean = 0.0
+    ssqdm = 0.0
+
+    for i in range(n):
+        if pos[i] == 0:
+            head6 = tail6
+            head24 = tail24
+            nobs = wet = 0
+            mean = ssqdm = 0.0
+            sum_x[:] = 0.0
+            comp_add[:] = 0.0
+            comp_remove[:] = 0.0
+            same_run = 0
+            prev = p[i]
+
+        x = p[i]
+        if x == prev:
+            same_run += 1
+        else:
+            same_run = 1
+        prev = x
+        for j in range(n_sums):
+            w = sum_windows[j]
+            if pos[i] >= w:
+                y = -p[i - w] - comp_remove[j]
+                t = sum_x[j] + y
+                comp_remove[j] = t - sum_x[j] - y
+                sum_x[j] = t
+            y = x - comp_add[j]
+            t = sum_x[j] + y
+            comp_add[j] = t - sum_x[j] - y
+            sum_x[j] = t
+            count = min(pos[i] + 1, w)
+            sums[j, i] = x * count if same_run >= count else sum_x[j]
+
+        while tail6 > head6 and p[dq6[tail6 - 1]] <= x:
+            tail6 -= 1
+        dq6[tail6] = i
+        tail6 += 1
+        if dq6[head6] <= i - 6:
+            head6 += 1
+
+        while tail24 > head24 and p[dq24[tail24 - 1]] <= x:
+            tail24 -= 1
+        dq24[tail24] = i
+        tail24 += 1
+        if dq24[head24] <= i - 24:
+            head24 += 1
+
+        nobs += 1
+        wet += x != 0.0
+        delta = x - mean
+        mean += delta / nobs
+        ssqdm += delta * (x - mean)
+        if pos[i] >= 24:
+            y = p[i - 24]
+            nobs -= 1
+            wet -= y != 0.0
+            delta = y - mean
+            mean -= delta / nobs
+            ssqdm -= delta * (y - mean)
+        if wet == 0:
+            mean = 0.0
+            ssqdm = 0.0
+
+        if pos[i] >= 5:
+            max6[i] = p[dq6[head6]]
+        if pos[i] >= 23:
+            max24[i] = p[dq24[head24]]
+            std24[i] = np.sqrt(max(ssqdm, 0.0) / (nobs - 1))
+
+    return sums, max6, max24, std24
+
+
+def _fill_median(a, starts):
+    """Fills NaNs in place with the median of the rest of their group, if any."""
+    for group in np.split(a, starts[1:]):
+        missing = np.isnan(group)
+        if missing.any() and not missing.all():
+            group[missing] = np.nanmedian(group)
+    return a
+
+
+def _engineer_from_arrays(p, sm1, sm2, temperature, humidity, pressure,
+                          wind_speed, time_i8, starts):
+    """
+    Computes every engineered feature from gap-filled input arrays, sorted by
+    time within contiguous groups that begin at the indices in starts.
+    """
+    features = {}
+    n = len(p)
+    pos = np.arange(n) - np.repeat(starts, np.diff(np.append(starts, n)))
+
+    # 1. Rolling rainfall accumulations 
+    # Most important flood predictors. 72h captures multi-day events.
+    windows = (("3h", 3), ("6h", 6), ("12h", 12), ("24h", 24),
+               ("48h", 48), ("72h", 72), ("7d", 168))
+    sums, max6, max24, std24 = _windows(
+        p, pos, np.array([window for _, window in windows], dtype=np.int64)
+    )
+    features["rainfall_1h"] = p
+    for (label, _), window_sum in zip(windows, sums):
+        features[f"rainfall_{label}"] = window_sum
+
+    # 2. Antecedent Precipitation Index (API) 
+    # Classic hydrology metric. API_t = k * (API_{t-1} + P_t)
+    # k=0.85 means yesterday's rain still has 85% weight today
+    features["antecedent_precipitation_index"] = _apid(p, pos, 0.85)
+
+    # 3. Rainfall intensity metrics 
+    # 30mm/hour burst is more dangerous than 30mm over 24 hours
+    features["peak_intensity_6h"]        = max6
+    features["peak_intensity_24h"]       = max24
+    features["rainfall_variability_24h"] = std24
+
+    # 4. Soil moisture features
+    # Saturated soil cannot absorb more water → all becomes runoff
+    sm_combined = sm1 * 0.6 + sm2 * 0.4
+
+    features["soil_moisture_surface"]    = sm1
+    features["soil_moisture_deep"]       = sm2
+    features["soil_moisture_combined"]   = sm_combined
+    features["soil_moisture_change_6h"]  = _diff(sm_combined, 6, pos)
+    features["soil_moisture_change_24h"] = _diff(sm_combined, 24, pos)
+
+    # 5. Atmospheric conditions
+    features["temperature"]         = temperature
+    features["humidity"]            = humidity
+    features["pressure"]            = pressure
+    features["wind_speed"]          = wind_speed
+    features["pressure_change_6h"]  = _diff(pressure, 6, pos)
+    features["pressure_change_24h"] = _diff(pressure, 24, pos)
+
+    # 6. Interaction features
+    features["humidity_x_rainfall"] = humidity * features["rainfall_24h"] / 100
+    features["heat_index"]          = temperature * humidity / 100
+
+    # 7. Temporal features (cyclical encoding)
+    # Jan (1) and Dec (12) are adjacent months, sin/cos captures this
+    time        = pd.DatetimeIndex(time_i8)
+    month       = time.month.to_numpy()
+    day_of_year = time.dayofyear.to_numpy()
+    month_angle = month.astype(np.float32) * np.float32(2 * np.pi / 12)
+    doy_angle   = day_of_year.astype(np.float32) * np.float32(2 * np.pi / 365)
+    features["month"]           = month
+    features["month_sin"]       = np.sin(month_angle)
+    features["month_cos"]       = np.cos(month_angle)
+    features["day_of_year"]     = day_of_year
+    features["day_of_year_sin"] = np.sin(doy_angle)
+    features["day_of_year_cos"] = np.cos(doy_angle)
+    features["is_wet_season"]   = (
+        ((month >= 4) & (month <= 6)) | ((month >= 9) & (month <= 11))
+    ).astype(np.int8)
+
+    return features
+
 
 class FloodFeatureEngineer:
     """
@@ -18,76 +246,59 @@ class FloodFeatureEngineer:
     """
 
     def __init__(self):
-        self.scaler = StandardScaler()
+        # Feature matrices are fresh float32 arrays, so scaling in place is safe
+        self.scaler = StandardScaler(copy=False)
         self.feature_columns = []
         self._fitted = False
 
     def engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy().sort_values("time").reset_index(drop=True)
+        # Sorting already returns a new frame, so no extra copy is needed.
+        # Features are computed on plain numpy arrays and attached in one concat.
+        # A multi-region frame is processed in one batch, with each region kept
+        # contiguous and treated as its own series (windows, fills, diffs).
+        if "region_name" in df.columns:
+            df = df.sort_values(["region_name", "time"], ignore_index=True)
+            groups = pd.factorize(df["region_name"])[0]
+        else:
+            df = df.sort_values("time", ignore_index=True)
+            groups = np.zeros(len(df), dtype=np.int64)
+        new_group = np.ones(len(df), dtype=bool)
+        new_group[1:] = groups[1:] != groups[:-1]
+        starts = np.flatnonzero(new_group)
+
         df["precipitation"] = df["precipitation"].fillna(0)
+        p = df["precipitation"].to_numpy(dtype=np.float64)
 
-        # 1. Rolling rainfall accumulations 
-        # Most important flood predictors. 72h captures multi-day events.
-        df["rainfall_1h"]   = df["precipitation"]
-        df["rainfall_3h"]   = df["precipitation"].rolling(3,   min_periods=1).sum()
-        df["rainfall_6h"]   = df["precipitation"].rolling(6,   min_periods=1).sum()
-        df["rainfall_12h"]  = df["precipitation"].rolling(12,  min_periods=1).sum()
-        df["rainfall_24h"]  = df["precipitation"].rolling(24,  min_periods=1).sum()
-        df["rainfall_48h"]  = df["precipitation"].rolling(48,  min_periods=1).sum()
-        df["rainfall_72h"]  = df["precipitation"].rolling(72,  min_periods=1).sum()
-        df["rainfall_7d"]   = df["precipitation"].rolling(168, min_periods=1).sum()
-
-        # 2. Antecedent Precipitation Index (API) 
-        # Classic hydrology metric. API_t = k * (API_{t-1} + P_t)
-        # k=0.85 means yesterday's rain still has 85% weight today
-        k = 0.85
-        api = np.zeros(len(df))
-        for i in range(1, len(df)):
-            api[i] = k * (api[i - 1] + df["precipitation"].iloc[i])
-        df["antecedent_precipitation_index"] = api
-
-        # 3. Rainfall intensity metrics 
-        # 30mm/hour burst is more dangerous than 30mm over 24 hours
-        df["peak_intensity_6h"]        = df["precipitation"].rolling(6).max().fillna(0)
-        df["peak_intensity_24h"]       = df["precipitation"].rolling(24).max().fillna(0)
-        df["rainfall_variability_24h"] = df["precipitation"].rolling(24).std().fillna(0)
-
-        # 4. Soil moisture features
-        # Saturated soil cannot absorb more water → all becomes runoff
-        sm1 = df["soil_moisture_0_to_7cm"].fillna(
-            df["soil_moisture_0_to_7cm"].median()
+        # Kept in float64 (as the fetcher delivers it) so soil_moisture_combined
+        # meets the 0.35 label threshold exactly as before. Deep soil moisture
+        # falls back to the surface reading.
+        sm1 = _fill_median(
+            df["soil_moisture_0_to_7cm"].to_numpy(dtype=np.float64, copy=True), starts
         )
-        sm2 = df.get("soil_moisture_7_to_28cm", sm1).fillna(sm1)
+        if "soil_moisture_7_to_28cm" in df.columns:
+            sm2 = df["soil_moisture_7_to_28cm"].to_numpy(dtype=np.float64, copy=True)
+            missing = np.isnan(sm2)
+            sm2[missing] = sm1[missing]
+        else:
+            sm2 = sm1.copy()
 
-        df["soil_moisture_surface"]    = sm1
-        df["soil_moisture_deep"]       = sm2
-        df["soil_moisture_combined"]   = sm1 * 0.6 + sm2 * 0.4
-        df["soil_moisture_change_6h"]  = df["soil_moisture_combined"].diff(6).fillna(0)
-        df["soil_moisture_change_24h"] = df["soil_moisture_combined"].diff(24).fillna(0)
-
-        # 5. Atmospheric conditions
-        df["temperature"]        = df["temperature_2m"].fillna(
-            df["temperature_2m"].median()
+        features = _engineer_from_arrays(
+            p,
+            sm1,
+            sm2,
+            _fill_median(df["temperature_2m"].to_numpy(dtype=np.float64, copy=True), starts),
+            df["relative_humidity_2m"].fillna(80).to_numpy(dtype=np.float64),
+            df["surface_pressure"].fillna(1013).to_numpy(dtype=np.float64),
+            df["wind_speed_10m"].fillna(0).to_numpy(dtype=np.float64),
+            df["time"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+            starts,
         )
-        df["humidity"]           = df["relative_humidity_2m"].fillna(80)
-        df["pressure"]           = df["surface_pressure"].fillna(1013)
-        df["wind_speed"]         = df["wind_speed_10m"].fillna(0)
-        df["pressure_change_6h"] = df["pressure"].diff(6).fillna(0)
-        df["pressure_change_24h"]= df["pressure"].diff(24).fillna(0)
-
-        # 6. Interaction features
-        df["humidity_x_rainfall"] = df["humidity"] * df["rainfall_24h"] / 100
-        df["heat_index"]          = df["temperature"] * df["humidity"] / 100
-
-        # 7. Temporal features (cyclical encoding)
-        # Jan (1) and Dec (12) are adjacent months, sin/cos captures this
-        df["month"]           = df["time"].dt.month
-        df["month_sin"]       = np.sin(2 * np.pi * df["month"] / 12)
-        df["month_cos"]       = np.cos(2 * np.pi * df["month"] / 12)
-        df["day_of_year"]     = df["time"].dt.dayofyear
-        df["day_of_year_sin"] = np.sin(2 * np.pi * df["day_of_year"] / 365)
-        df["day_of_year_cos"] = np.cos(2 * np.pi * df["day_of_year"] / 365)
-        df["is_wet_season"]   = df["month"].isin([4, 5, 6, 9, 10, 11]).astype(int)
+
+        # Re-engineering an already engineered frame replaces the old columns
+        stale = df.columns.intersection(list(features))
+        if len(stale):
+            df = df.drop(columns=stale)
+        df = pd.concat([df, pd.DataFrame(features, index=df.index)], axis=1)
 
         self.feature_columns = [
             "rainfall_1h", "rainfall_3h", "rainfall_6h", "rainfall_12h",
@@ -111,41 +322,53 @@ class FloodFeatureEngineer:
         Assigns risk labels using World Meteorological Organization (WMO) heavy rainfall thresholds.
         In production: replace with actual historical flood event records.
         """
-        conditions = [
-            (df["rainfall_24h"] >= 150) | (df["rainfall_72h"] >= 300),
-            (df["rainfall_24h"] >= 75)  | (df["rainfall_72h"] >= 150),
-            (df["rainfall_24h"] >= 30)  |
-            ((df["rainfall_24h"] >= 15) & (df["soil_moisture_combined"] > 0.35)),
-        ]
-        choices = ["CRITICAL", "HIGH", "MEDIUM"]
-        df["risk_level"] = np.select(conditions, choices, default="LOW")
+        r24 = df["rainfall_24h"].to_numpy()
+        r72 = df["rainfall_72h"].to_numpy()
+        smc = df["soil_moisture_combined"].to_numpy()
 
-        risk_map = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
-        df["risk_label"] = df["risk_level"].map(risk_map)
+        critical = (r24 >= 150) | (r72 >= 300)
+        high     = (r24 >= 75)  | (r72 >= 150)
+        medium   = (r24 >= 30)  | ((r24 >= 15) & (smc > 0.35))
+
+        # 0=LOW, 1=MEDIUM, 2=HIGH, 3=CRITICAL; the most severe match wins
+        label = np.where(critical, 3, np.where(high, 2, np.where(medium, 1, 0))).astype(np.int8)
+        df["risk_level"] = pd.Categorical.from_codes(
+            label, categories=["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+        )
+        df["risk_label"] = label
         return df
 
     def fit_transform(self, df: pd.DataFrame) -> np.ndarray:
-        X = df[self.feature_columns].fillna(0).values
-        result = self.scaler.fit_transform(X)
+        X = df[self.feature_columns].fillna(0).to_numpy(dtype=np.float32)
+        result = self.scaler.fit_transform(X).astype(np.float32, copy=False)
         self._fitted = True
         return result
 
     def transform(self, df: pd.DataFrame) -> np.ndarray:
         if not self._fitted:
             raise ValueError("Call fit_transform before transform")
-        return self.scaler.transform(df[self.feature_columns].fillna(0).values)
+        X = df[self.feature_columns].fillna(0).to_numpy(dtype=np.float32)
+        return self.scaler.transform(X).astype(np.float32, copy=False)
 
     def save(self, path: str):
         Path(path).parent.mkdir(parents=True, exist_ok=True)
-        joblib.dump({
-            "scaler": self.scaler,
-            "feature_columns": self.feature_columns,
-            "fitted": self._fitted
-        }, path)
+        with zstd.open(path, "wb", cctx=zstd.ZstdCompressor(level=6)) as f:
+            pickle.dump({
+                "scaler": self.scaler,
+                "feature_columns": self.feature_columns,
+                "fitted": self._fitted
+            }, f, protocol=5)
         logger.info(f"Preprocessor saved to {path}")
 
     def load(self, path: str):
-        data = joblib.load(path)
+        with open(path, "rb") as f:
+            is_zstd = f.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC
+        if is_zstd:
+            with zstd.open(path, "rb") as f:
+                data = pickle.load(f)
+        else:
+            # Preprocessors saved before the zstd format were plain joblib dumps
+            data = joblib.load(path)
         self.scaler = data["scaler"]
         self.feature_columns = data["feature_columns"]
         self._fitted = data.get("fitted", True)
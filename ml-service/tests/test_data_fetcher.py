@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import numpy as np
+import orjson
+import pandas as pd
+import pytest
+
+from app.services import data_fetcher
+from app.services.data_fetcher import WeatherDataFetcher, download_training_data
+from app.services.preprocessor import FloodFeatureEngineer
+from tests.test_preprocessor import baseline_risk_label, make_hourly
+
+
+def open_meteo_payload(raw: pd.DataFrame) -> bytes:
+    """Serialises a frame the way the archive API returns it (nulls for gaps)."""
+    hourly = {"time": raw["time"].dt.strftime("%Y-%m-%dT%H:%M").tolist()}
+    for var in WeatherDataFetcher.HOURLY_VARIABLES:
+        hourly[var] = [None if np.isnan(v) else v for v in raw[var].tolist()]
+    return orjson.dumps({"hourly": hourly})
+
+
+def test_parsed_payload_labels_match_float64_baseline():
+    raw = make_hourly(43_800, seed=3)
+    # Mixed-depth readings whose combined value is exactly 0.35
+    raw.loc[2000:2100, "soil_moisture_0_to_7cm"] = 0.346
+    raw.loc[2000:2100, "soil_moisture_7_to_28cm"] = 0.356
+    raw.loc[2000:2100, "precipitation"] = 0.8
+    raw.loc[raw.index % 101 == 0, "soil_moisture_7_to_28cm"] = np.nan
+
+    parsed = WeatherDataFetcher()._hourly_frame(open_meteo_payload(raw))
+    engineer = FloodFeatureEngineer()
+    df = engineer.create_labels(engineer.engineer_features(parsed))
+
+    sm1 = raw["soil_moisture_0_to_7cm"].fillna(raw["soil_moisture_0_to_7cm"].median())
+    sm2 = raw["soil_moisture_7_to_28cm"].fillna(sm1)
+    precipitation = raw["precipitation"]
+    expected = baseline_risk_label(
+        precipitation.rolling(24, min_periods=1).sum().to_numpy(),
+        precipitation.rolling(72, min_periods=1).sum().to_numpy(),
+        (sm1 * 0.6 + sm2 * 0.4).to_numpy(),
+    )
+    np.testing.assert_array_equal(df["risk_label"].to_numpy(), expected)
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """
+    Runs download_training_data against a mocked archive API inside tmp_path.
+    Returns the per-latitude request counts and the set of failing latitudes.
+    """
+    requests, failing = {}, set()
+    payload = open_meteo_payload(make_hourly(48, seed=4))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        lat = float(request.url.params["latitude"])
+        requests[lat] = requests.get(lat, 0) + 1
+        if lat in failing:
+            return httpx.Response(500)
+        return httpx.Response(200, content=payload)
+
+    real_client = httpx.AsyncClient
+
+    def mock_client(**kwargs):
+        kwargs.pop("http2", None)
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(data_fetcher.httpx, "AsyncClient", mock_client)
+    monkeypatch.setattr(data_fetcher.asyncio, "sleep", no_sleep)
+    monkeypatch.setattr(data_fetcher.settings, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data" / "processed").mkdir(parents=True)
+    return requests, failing
+
+
+def test_download_streams_regions_to_parquet_and_reuses_cache(archive):
+    requests, failing = archive
+    failing.add(19.076)  # Mumbai
+
+    path = asyncio.run(download_training_data())
+    df = pd.read_parquet(path)
+
+    regions = {"Houston", "NewOrleans", "Sacramento", "Bangladesh",
+               "Mekong", "Nairobi", "NileDelta"}
+    assert df["region_name"].dtype == "category"
+    assert set(df["region_name"].unique()) == regions
+    assert df.groupby("region_name", observed=True).size().eq(48).all()
+    assert sum(requests.values()) == 8
+
+    # Second run: every region that succeeded is served from the cache
+    requests.clear()
+    asyncio.run(download_training_data())
+    assert requests == {19.076: 1}
+    assert len(pd.read_parquet(path)) == len(df)
+
+
+def test_download_raises_when_every_region_fails(archive, tmp_path):
+    requests, failing = archive
+    failing.update({29.7604, 29.9511, 38.5816, 23.685, 19.076, 10.0452, -1.2921, 30.9})
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(download_training_data())
+    assert sum(requests.values()) == 8
+    assert not (tmp_path / "data" / "processed" / "training_data.parquet").exists()
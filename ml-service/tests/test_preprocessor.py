@@ -0,0 +1,151 @@
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.services.preprocessor import ZSTD_MAGIC, FloodFeatureEngineer
+
+RAINFALL_WINDOWS = {
+    "rainfall_3h": 3, "rainfall_6h": 6, "rainfall_12h": 12, "rainfall_24h": 24,
+    "rainfall_48h": 48, "rainfall_72h": 72, "rainfall_7d": 168,
+}
+
+
+def make_hourly(n: int, seed: int) -> pd.DataFrame:
+    """n hours of synthetic weather at Open-Meteo's reporting resolution."""
+    rng = np.random.default_rng(seed)
+    # Precipitation comes in 0.1 mm steps, with occasional storms so that
+    # every risk level and plenty of exact threshold hits show up
+    precipitation = rng.gamma(0.3, 4.0, n) * (rng.random(n) < 0.3)
+    precipitation[rng.random(n) < 0.01] *= 15
+    return pd.DataFrame({
+        "time": pd.date_range("2021-01-01", periods=n, freq="h"),
+        "precipitation": np.round(precipitation, 1),
+        "temperature_2m": np.round(rng.normal(25, 5, n), 1),
+        "relative_humidity_2m": np.round(rng.uniform(20, 100, n)),
+        "surface_pressure": np.round(rng.normal(1010, 5, n), 1),
+        "wind_speed_10m": np.round(rng.uniform(0, 30, n), 1),
+        "soil_moisture_0_to_7cm": np.round(rng.uniform(0.1, 0.5, n), 3),
+        "soil_moisture_7_to_28cm": np.round(rng.uniform(0.1, 0.5, n), 3),
+    })
+
+
+def baseline_risk_label(r24, r72, smc) -> np.ndarray:
+    """The original np.select labelling, kept as the reference."""
+    conditions = [
+        (r24 >= 150) | (r72 >= 300),
+        (r24 >= 75)  | (r72 >= 150),
+        (r24 >= 30)  | ((r24 >= 15) & (smc > 0.35)),
+    ]
+    return np.select(conditions, [3, 2, 1], default=0)
+
+
+def test_rainfall_windows_match_pandas_rolling_sum():
+    raw = make_hourly(43_800, seed=0)
+    df = FloodFeatureEngineer().engineer_features(raw)
+
+    precipitation = raw["precipitation"]
+    for column, window in RAINFALL_WINDOWS.items():
+        expected = precipitation.rolling(window, min_periods=1).sum().to_numpy()
+        np.testing.assert_array_equal(df[column].to_numpy(), expected, err_msg=column)
+
+
+def test_risk_labels_match_rolling_sum_baseline():
+    raw = make_hourly(43_800, seed=1)
+    engineer = FloodFeatureEngineer()
+    df = engineer.create_labels(engineer.engineer_features(raw))
+
+    precipitation = raw["precipitation"]
+    expected = baseline_risk_label(
+        precipitation.rolling(24, min_periods=1).sum().to_numpy(),
+        precipitation.rolling(72, min_periods=1).sum().to_numpy(),
+        df["soil_moisture_combined"].to_numpy(),
+    )
+    assert len(np.unique(expected)) == 4
+    np.testing.assert_array_equal(df["risk_label"].to_numpy(), expected)
+
+
+def test_regions_are_engineered_independently():
+    regions = {name: make_hourly(2_000, seed) for seed, name in enumerate(["A", "B", "C"])}
+    combined = pd.concat(
+        [frame.assign(region_name=name) for name, frame in regions.items()],
+        ignore_index=True,
+    ).sample(frac=1, random_state=0)
+
+    engineer = FloodFeatureEngineer()
+    batched = engineer.engineer_features(combined)
+    for name, frame in regions.items():
+        single = engineer.engineer_features(frame)
+        region = batched[batched["region_name"] == name].reset_index(drop=True)
+        for column in engineer.feature_columns:
+            np.testing.assert_allclose(
+                region[column].to_numpy(np.float64),
+                single[column].to_numpy(np.float64),
+                rtol=1e-6, atol=1e-9, err_msg=f"{name}:{column}",
+            )
+
+
+def test_soil_moisture_labels_match_float64_baseline():
+    raw = make_hourly(5_000, seed=2)
+    # A combined reading of exactly 0.35 must stay below the MEDIUM soil threshold
+    raw.loc[1000:1100, ["soil_moisture_0_to_7cm", "soil_moisture_7_to_28cm"]] = 0.35
+    raw.loc[1000:1100, "precipitation"] = 0.8
+    # Mixed-depth readings whose weighted combination sits on or next to 0.35
+    for start, (surface, deep) in zip(range(2000, 4000, 400), [
+        (0.346, 0.356), (0.344, 0.359), (0.353, 0.3455), (0.351, 0.349), (0.355, 0.342),
+    ]):
+        raw.loc[start:start + 100, "soil_moisture_0_to_7cm"] = surface
+        raw.loc[start:start + 100, "soil_moisture_7_to_28cm"] = deep
+        raw.loc[start:start + 100, "precipitation"] = 0.8
+    raw.loc[raw.index % 97 == 0, "soil_moisture_0_to_7cm"] = np.nan
+    raw.loc[raw.index % 89 == 0, "soil_moisture_7_to_28cm"] = np.nan
+
+    engineer = FloodFeatureEngineer()
+    df = engineer.create_labels(engineer.engineer_features(raw))
+
+    sm1 = raw["soil_moisture_0_to_7cm"].fillna(raw["soil_moisture_0_to_7cm"].median())
+    sm2 = raw["soil_moisture_7_to_28cm"].fillna(sm1)
+    smc = (sm1 * 0.6 + sm2 * 0.4).to_numpy()
+    np.testing.assert_array_equal(df["soil_moisture_combined"].to_numpy(), smc)
+
+    precipitation = raw["precipitation"]
+    expected = baseline_risk_label(
+        precipitation.rolling(24, min_periods=1).sum().to_numpy(),
+        precipitation.rolling(72, min_periods=1).sum().to_numpy(),
+        smc,
+    )
+    np.testing.assert_array_equal(df["risk_label"].to_numpy(), expected)
+    assert (df.loc[1100, "rainfall_24h"] >= 15) and (df.loc[1100, "risk_label"] == 0)
+    assert df.loc[2450, "risk_label"] == 0  # 0.344 / 0.359 combine to exactly 0.35
+    assert df.loc[3250, "risk_label"] == 1  # 0.351 / 0.349 combine to 0.3502
+
+
+def test_save_load_round_trip(tmp_path):
+    engineer = FloodFeatureEngineer()
+    df = engineer.engineer_features(make_hourly(2_000, seed=5))
+    expected = engineer.fit_transform(df)
+
+    path = tmp_path / "preprocessor.pkl"
+    engineer.save(str(path))
+    assert path.read_bytes()[:4] == ZSTD_MAGIC
+
+    loaded = FloodFeatureEngineer()
+    loaded.load(str(path))
+    assert loaded.feature_columns == engineer.feature_columns
+    np.testing.assert_array_equal(loaded.transform(df), expected)
+
+
+def test_load_reads_legacy_joblib_file(tmp_path):
+    engineer = FloodFeatureEngineer()
+    df = engineer.engineer_features(make_hourly(2_000, seed=6))
+    expected = engineer.fit_transform(df)
+
+    path = tmp_path / "preprocessor.pkl"
+    joblib.dump({
+        "scaler": engineer.scaler,
+        "feature_columns": engineer.feature_columns,
+        "fitted": True
+    }, path, compress=3)
+
+    loaded = FloodFeatureEngineer()
+    loaded.load(str(path))
+    np.testing.assert_array_equal(loaded.transform(df), expected)